@@ -1,74 +1,219 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import subprocess
 import pyperclip
 import re
 import sys
 import shutil
+import shlex
 import os
-import glob
+import itertools
+import json
+import threading
 import time
 import random
-from urllib.parse import urlparse, parse_qs
+from types import SimpleNamespace
+import tempfile
+import html
+
+# Subtitle text extraction patterns, compiled once at import time.
+# Text lines are everything except blanks, cue numbers and timing lines
+# (plus NOTE lines in WebVTT, whose header block is consumed separately);
+# the skip patterns test one line at a time so files can be streamed.
+_TAG_RE = re.compile(r'<[^>]+>')
+_SRT_SKIP_RE = re.compile(r'\s*(?:\d*\s*$|.*-->)')
+_VTT_SKIP_RE = re.compile(r'\s*(?:\d*\s*$|NOTE|<|.*-->)')
+
+# YouTube URL patterns: watch?v=ID, youtu.be/ID, /embed/ID and /shorts/ID, plus the list= playlist parameter
+_VIDEO_ID_RE = re.compile(r'(?:youtu\.be/|/embed/|/shorts/|[?&]v=)([0-9A-Za-z_-]{11})')
+_LIST_ID_RE = re.compile(r'[?&]list=([0-9A-Za-z_-]+)')
+
+# Per-user cache location (honours XDG_CACHE_HOME, defaults to ~/.cache/ytcc)
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'ytcc')
+YT_DLP_PATH_CACHE = os.path.join(CACHE_DIR, 'ytdlp_path.json')
+TRANSCRIPT_CACHE_TTL = 24 * 60 * 60  # Seconds a cached transcript is reused
+
+# yt-dlp is killed after this many seconds without output (longer than its 60s socket
+# timeout, so a retrying download is not cut off), or after the hard limit overall
+YT_DLP_IDLE_TIMEOUT = 90
+YT_DLP_HARD_TIMEOUT = 300
+
+# Retry backoff: RETRY_BASE_DELAY * 2**attempt seconds, capped at RETRY_MAX_DELAY, +/- RETRY_JITTER
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_JITTER = 0.5
 
 def find_yt_dlp():
-    """Checks if yt-dlp is installed and accessible in the system's PATH."""
+    """
+    Checks if yt-dlp is installed and accessible in the system's PATH.
+    The resolved path is cached so later runs skip the PATH walk; the cache is
+    ignored once the cached binary disappears or its mtime changes.
+    """
+    try:
+        with open(YT_DLP_PATH_CACHE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if os.path.getmtime(cached['path']) == cached['mtime']:
+            return cached['path']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
     path = shutil.which('yt-dlp')
     if path is None:
         print("FATAL ERROR: 'yt-dlp' is not installed or not in your system's PATH.", file=sys.stderr)
         print("Please install it to use this script. See: https://github.com/yt-dlp/yt-dlp", file=sys.stderr)
         sys.exit(1)
+    
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(YT_DLP_PATH_CACHE, 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'mtime': os.path.getmtime(path)}, f)
+    except OSError:
+        pass  # Caching is best-effort
     return path
 
 def extract_video_id(url):
     """Extract video ID from YouTube URL for better file matching."""
+    match = _VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+def transcript_cache_path(video_id):
+    """Path of the cached transcript for a video ID (IDs come from _VIDEO_ID_RE, so are safe filenames)."""
+    if not video_id:
+        return None
+    return os.path.join(CACHE_DIR, f'{video_id}.txt')
+
+def load_cached_transcript(video_id):
+    """
+    Return the cached transcript for a video if it is younger than TRANSCRIPT_CACHE_TTL.
+    An expired entry is deleted when found, so the cache does not grow without bound.
+    """
+    cache_path = transcript_cache_path(video_id)
+    if cache_path is None:
+        return None
     try:
-        parsed = urlparse(url)
-        if 'youtube.com' in parsed.netloc:
-            if 'watch' in parsed.path:
-                return parse_qs(parsed.query).get('v', [None])[0]
-            elif 'embed' in parsed.path:
-                return parsed.path.split('/')[-1]
-        elif 'youtu.be' in parsed.netloc:       
-            return parsed.path.lstrip('/')
-    except:
+        if time.time() - os.path.getmtime(cache_path) < TRANSCRIPT_CACHE_TTL:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        os.remove(cache_path)
+        verbose_print(f"删除过期的缓存: {cache_path}")
+    except OSError:
         pass
     return None
 
+def save_cached_transcript(video_id, transcript):
+    """Atomically write a transcript to the cache so repeat runs skip yt-dlp (best-effort)."""
+    cache_path = transcript_cache_path(video_id)
+    if cache_path is None:
+        return
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(transcript)
+        os.replace(tmp_path, cache_path)
+        verbose_print(f"转录文本已缓存: {cache_path}")
+    except OSError as e:
+        verbose_print(f"缓存转录文本失败: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
 def check_if_playlist_url(url):
     """检查URL是否包含播放列表参数，并返回相关信息"""
+    verbose_print(f"解析URL: {url}")
+    match = _LIST_ID_RE.search(url)
+    if match:
+        list_id = match.group(1)
+        verbose_print(f"检测到播放列表 - list_id: {list_id}")
+        return True, list_id
+    verbose_print("未检测到播放列表参数")
+    return False, None
+
+def format_command(command):
+    """Render a command list as a copy-pasteable shell line (shlex.join for Python < 3.8)."""
+    return ' '.join(shlex.quote(arg) for arg in command)
+
+def list_subtitle_files(directory='.', marker='.en', suffix='.srt'):
+    """
+    List subtitle files (e.g. *.en*.srt) with a single os.scandir pass over the directory.
+    suffix may be a tuple to match several subtitle formats in the same pass.
+    """
+    with os.scandir(directory) as entries:
+        return [entry.name for entry in entries
+                if entry.name.endswith(suffix) and marker in entry.name]
+
+def run_yt_dlp(command, idle_timeout=YT_DLP_IDLE_TIMEOUT, hard_timeout=YT_DLP_HARD_TIMEOUT):
+    """
+    Run yt-dlp, streaming its output line by line instead of buffering it until exit.
+    stdout is always drained (so its progress lines count as activity) but only echoed in
+    verbose mode; stderr is kept for error reporting.
+    Raises subprocess.TimeoutExpired when yt-dlp stays silent for idle_timeout seconds or
+    runs longer than hard_timeout, and subprocess.CalledProcessError on a non-zero exit.
+    """
+    verbose = CFG.verbose  # Read once; the reader threads check it per line
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               encoding='utf-8', errors='replace', bufsize=1)
+    stderr_lines = []
+    last_output = started = time.monotonic()
+    
+    def pump(pipe, keep):
+        nonlocal last_output
+        for line in pipe:
+            last_output = time.monotonic()
+            if keep:
+                stderr_lines.append(line)
+            if verbose:
+                verbose_print(f"yt-dlp: {line.rstrip()}")
+        pipe.close()
+    
+    # Reader threads (rather than selectors) so pipes can be multiplexed on Windows too
+    readers = [threading.Thread(target=pump, args=(process.stderr, True), daemon=True),
+               threading.Thread(target=pump, args=(process.stdout, False), daemon=True)]
+    for reader in readers:
+        reader.start()
+    
     try:
-        verbose_print(f"解析URL: {url}")
-        parsed = urlparse(url)
-        query_params = parse_qs(parsed.query)
-        verbose_print(f"解析后的查询参数: {query_params}")
-        
-        if 'list' in query_params:
-            list_id = query_params['list'][0]
-            video_id = query_params.get('v', [None])[0]
-            verbose_print(f"检测到播放列表 - list_id: {list_id}, video_id: {video_id}")
-            return True, list_id, video_id
-        verbose_print("未检测到播放列表参数")
-        return False, None, None
-    except Exception as e:
-        verbose_print(f"URL解析出错: {e}")
-        return False, None, None
+        while True:
+            try:
+                process.wait(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                now = time.monotonic()
+                if now - last_output > idle_timeout or now - started > hard_timeout:
+                    raise subprocess.TimeoutExpired(command, now - started, stderr=''.join(stderr_lines))
+    except BaseException:
+        # Timeouts and Ctrl+C alike: never leave yt-dlp running behind us
+        process.kill()
+        process.wait()
+        raise
+    
+    for reader in readers:
+        reader.join(timeout=5)
+    stderr = ''.join(stderr_lines)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stderr=stderr)
 
-def select_best_subtitle_file(srt_files, video_url):
+def select_best_subtitle_file(srt_files, video_id):
     """
     Intelligently select the best subtitle file from multiple options.
     Priority: exact video match > shortest filename > user selection
+    video_id is extracted once by the caller (None when the URL has no recognisable ID).
     """
     if len(srt_files) == 1:
         return srt_files[0]
     
+    # Build the numbered listing and the shortest-name fallback once, reuse below
+    file_listing = '\n'.join(f"   {i}. {file}" for i, file in enumerate(srt_files, 1))
+    shortest = min(srt_files, key=len)
+    
     print(f"-> Found {len(srt_files)} subtitle files:")
-    for i, file in enumerate(srt_files, 1):
-        print(f"   {i}. {file}")
+    print(file_listing)
     
-    # Try to match by video ID first
-    video_id = extract_video_id(video_url)
+    # Try to match by video ID first (skipped entirely when there is no ID)
     if video_id:
         for file in srt_files:
             if video_id in file:
@@ -76,24 +221,21 @@ def select_best_subtitle_file(srt_files, video_url):
                 return file
     
     # If auto mode is enabled, select shortest filename
-    if AUTO_SELECT_MODE:
-        selected = min(srt_files, key=len)
-        print(f"-> Auto-selected (shortest name): {selected}")
-        return selected
+    if CFG.auto:
+        print(f"-> Auto-selected (shortest name): {shortest}")
+        return shortest
     
     # Interactive selection for multiple files
     print("\n-> Multiple subtitle files found. Please choose:")
-    for i, file in enumerate(srt_files, 1):
-        print(f"   {i}. {file}")
+    print(file_listing)
     
     while True:
         try:
             choice = input(f"-> Enter number (1-{len(srt_files)}) or press Enter for auto-select: ").strip()
             if not choice:
                 # Auto-select: prefer shorter filenames (usually more specific)
-                selected = min(srt_files, key=len)
-                print(f"-> Auto-selected (shortest name): {selected}")
-                return selected
+                print(f"-> Auto-selected (shortest name): {shortest}")
+                return shortest
             
             choice_num = int(choice)
             if 1 <= choice_num <= len(srt_files):
@@ -108,39 +250,71 @@ def select_best_subtitle_file(srt_files, video_url):
             print("\n-> Cancelled by user")
             return None
 
+def _parse_subtitle(lines, skip_re):
+    """
+    Shared SRT/VTT parser: extracts the spoken text from any iterable of lines
+    (e.g. an open file), skipping every line matched by skip_re.
+    Lines are consumed one at a time, so the whole file is never held in memory.
+    """
+    # Skip sequence numbers, timestamps, headers, and empty lines; filterfalse
+    # runs the compiled skip test from C, and tag-free lines skip the re.sub call
+    stripped = ((_TAG_RE.sub('', line) if '<' in line else line).strip()
+                for line in itertools.filterfalse(skip_re.match, lines))
+    # Decode entities such as &amp; and &gt;&gt; (YouTube's speaker-change marker);
+    # likewise only lines containing '&' pay for the html.unescape call
+    cleaned = (html.unescape(line) if '&' in line else line for line in stripped)
+    
+    # Only keep non-empty, unique lines. Lines are compared word by word,
+    # case- and whitespace-insensitively. For auto-caption rolling cues, a line
+    # whose words open or close the previously kept line is dropped, and a line
+    # that extends the previous one replaces it. Only the hashes of the
+    # normalized lines are remembered, not the strings themselves.
+    kept = []
+    seen = set()
+    # Bind the per-line methods locally to skip attribute lookups in the loop
+    kept_append = kept.append
+    seen_add = seen.add
+    last = ()
+    for line in cleaned:
+        if not line:
+            continue
+        words = tuple(line.casefold().split())
+        key_hash = hash(words)
+        if key_hash in seen:
+            continue
+        n = len(words)
+        if n <= len(last) and (last[:n] == words or last[-n:] == words):
+            continue
+        seen_add(key_hash)
+        if last and words[:len(last)] == last:
+            kept[-1] = line  # Rolling cue grew: keep only the longer line
+        else:
+            kept_append(line)
+        last = words
+    return ' '.join(kept)
+
 def parse_srt(srt_content):
     """
     Parses SRT content to extract only the spoken text.
     V16.1: Added deduplication to prevent repeated sentences.
     """
-    lines = []
-    seen_lines = set()  # Track seen lines to avoid duplicates
-    
-    for line in srt_content.strip().split('\n'):
-        line = line.strip()
-        # Skip sequence numbers, timestamps, and empty lines
-        if not line or line.isdigit() or '-->' in line:
-            continue
-        # Remove any HTML-like tags
-        cleaned_line = re.sub(r'<[^>]+>', '', line)
-        cleaned_line = cleaned_line.strip()
-        
-        # Only add non-empty, unique lines
-        if cleaned_line and cleaned_line not in seen_lines:
-            lines.append(cleaned_line)
-            seen_lines.add(cleaned_line)
-    
-    return ' '.join(lines)
+    return parse_srt_stream(srt_content.splitlines())
 
-def get_transcript_with_yt_dlp(video_url, yt_dlp_path, max_retries=3):
+def parse_srt_stream(lines):
+    """Parses SRT lines from any iterable (e.g. an open file) to extract only the spoken text."""
+    return _parse_subtitle(lines, _SRT_SKIP_RE)
+
+def get_transcript_with_yt_dlp(video_url, yt_dlp_path, playlist_info, video_id, max_retries=2):
     """
     V16.7: Enhanced with playlist detection, single video download, verbose logging, and network optimization.
+    playlist_info is the (is_playlist, list_id) tuple from check_if_playlist_url;
+    video_id is the caller's extract_video_id result, reused for subtitle file matching.
     """
     print("--- Downloading auto-generated English subtitles... ---")
     verbose_print(f"开始下载流程，最大重试次数: {max_retries}")
     
-    # 检查是否为播放列表URL
-    is_playlist, list_id, video_id = check_if_playlist_url(video_url)
+    # 是否为播放列表URL（由调用方检查一次后传入）
+    is_playlist, list_id = playlist_info
     if is_playlist:
         print(f"-> 检测到播放列表URL (list={list_id})")
         if video_id:
@@ -148,301 +322,284 @@ def get_transcript_with_yt_dlp(video_url, yt_dlp_path, max_retries=3):
         else:
             print("-> 将只下载播放列表中第一个视频的字幕，不会下载整个播放列表")
     
-    # More conservative approach to avoid rate limiting with network optimization
-    command = [
-        yt_dlp_path,
-        '--skip-download',
-        '--write-auto-subs',
-        '--sub-langs', 'en',  # Just 'en' instead of 'en.*' to be more specific
-        '--convert-subs', 'srt',
-        '--output', '%(title)s.%(ext)s',
-        '--sleep-interval', '1',  # Add sleep between requests
-        '--max-sleep-interval', '3',  # Random sleep up to 3 seconds
-        '--retries', '5',  # 增加重试次数
-        '--socket-timeout', '60',  # 增加socket超时时间到60秒
-        '--fragment-retries', '10',  # 片段重试次数
-        '--retry-sleep', '5',  # 重试间隔时间
-    ]
-    
-    # 如果是播放列表URL，添加 --no-playlist 参数确保只下载单个视频
-    if is_playlist:
-        command.append('--no-playlist')
-        verbose_print("添加 --no-playlist 参数")
+    # yt-dlp writes into a private temporary directory; removing it on exit takes
+    # every subtitle file with it, including leftovers from failed attempts
+    with tempfile.TemporaryDirectory(prefix='ytcc-') as work_dir:
+        verbose_print(f"临时工作目录: {work_dir}")
+        
+        # More conservative approach to avoid rate limiting with network optimization
+        command = [
+            yt_dlp_path,
+            '--skip-download',
+            '--write-auto-subs',
+            '--sub-langs', 'en',  # Just 'en' instead of 'en.*' to be more specific
+            '--sub-format', 'vtt',  # Parsed directly, no ffmpeg conversion to SRT
+            '--output', os.path.join(work_dir, '%(title)s.%(ext)s'),
+            '--sleep-requests', '1',  # Throttle yt-dlp's own HTTP requests
+            '--sleep-interval', '1',  # Add sleep between downloads
+            '--max-sleep-interval', '3',  # Random sleep up to 3 seconds
+            '--retries', '5',  # 增加重试次数
+            '--socket-timeout', '60',  # 增加socket超时时间到60秒
+            '--fragment-retries', '10',  # 片段重试次数
+            '--retry-sleep', '5',  # 重试间隔时间
+        ]
+        
+        # 如果是播放列表URL，添加 --no-playlist 参数确保只下载单个视频
+        if is_playlist:
+            command.append('--no-playlist')
+            verbose_print("添加 --no-playlist 参数")
+        
+        command.append(video_url)
+        if CFG.verbose:  # Only format the command line when it is actually printed
+            verbose_print("构建的yt-dlp命令:", format_command(command))
+        
+        for attempt in range(max_retries):
+            try:
+                verbose_print(f"开始第 {attempt + 1} 次尝试")
+                if attempt > 0:
+                    # Capped exponential backoff with jitter
+                    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (1 << attempt))
+                    delay *= 1 + random.uniform(-RETRY_JITTER, RETRY_JITTER)
+                    print(f"-> Retrying in {delay:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
+                    verbose_print(f"等待 {delay:.1f} 秒后重试")
+                    time.sleep(delay)
+                
+                if CFG.verbose:
+                    print(f"-> Running command: {format_command(command)}")
+                verbose_print("执行yt-dlp命令...")
+                verbose_print("如果长时间无响应，请尝试 Ctrl+C 中断")
+                
+                # 添加超时机制，防止无限等待（长时间无输出或总时长超限）
+                try:
+                    result = run_yt_dlp(command)
+                    verbose_print(f"命令执行成功，返回码: {result.returncode}")
+                except subprocess.TimeoutExpired:
+                    print(f"-> 命令执行超时 ({YT_DLP_IDLE_TIMEOUT}秒无输出或超过{YT_DLP_HARD_TIMEOUT}秒)，可能的原因：", file=sys.stderr)
+                    print("   1. 网络连接慢或不稳定", file=sys.stderr)
+                    print("   2. 视频可能没有可用的字幕", file=sys.stderr)
+                    print("   3. YouTube限制了访问", file=sys.stderr)
+                    verbose_print("yt-dlp命令执行超时")
+                    continue  # 继续重试
+                
+                # yt-dlp should have created a .vtt file in the work directory
+                # Find the generated subtitle file
+                subtitle_files = list_subtitle_files(work_dir, suffix='.vtt')
+                verbose_print(f"搜索字幕文件，找到 {len(subtitle_files)} 个: {subtitle_files}")
+                if not subtitle_files:
+                    print("-> No subtitle file was created. The video might not have auto-generated English subtitles.", file=sys.stderr)
+                    return None
+                
+                # Intelligently select the best subtitle file
+                verbose_print("开始智能选择字幕文件...")
+                selected_file = select_best_subtitle_file(subtitle_files, video_id)
+                if not selected_file:
+                    print("-> No subtitle file selected.", file=sys.stderr)
+                    return None
+                
+                print(f"-> Processing subtitle file: {selected_file}")
+                verbose_print(f"选定的字幕文件: {selected_file}")
+                
+                # Read and parse the subtitle content
+                selected_path = os.path.join(work_dir, selected_file)
+                subtitle_size = os.path.getsize(selected_path)
+                verbose_print(f"字幕文件大小: {subtitle_size} 字节")
+                if not subtitle_size:
+                    print("-> Subtitle file was empty.", file=sys.stderr)
+                    return None
+                
+                # Stream the file through the parser line by line instead of reading it whole
+                verbose_print("流式解析字幕内容...")
+                transcript = parse_subtitle_file(selected_path)
+                verbose_print(f"解析后的转录文本长度: {len(transcript) if transcript else 0} 字符")
+                
+                if transcript:
+                    print("-> Subtitle successfully downloaded and parsed.")
+                    verbose_print("字幕下载和解析成功完成")
+                    return transcript
+                else:
+                    print("-> Failed to extract text from subtitle file.", file=sys.stderr)
+                    verbose_print("从字幕文件提取文本失败")
+                    return None
+
+            except subprocess.CalledProcessError as e:
+                error_message = e.stderr.lower() if e.stderr else ""
+                verbose_print(f"subprocess.CalledProcessError: 返回码={e.returncode}")
+                verbose_print(f"错误信息: {e.stderr}")
+                
+                # Check if it's a 429 error (rate limiting)
+                if "429" in error_message or "too many requests" in error_message:
+                    print(f"-> Rate limited (429 error) on attempt {attempt + 1}/{max_retries}", file=sys.stderr)
+                    verbose_print("检测到429限制错误")
+                    if attempt < max_retries - 1:
+                        continue  # Retry
+                    else:
+                        print("\n--- Trying fallback mode ---", file=sys.stderr)
+                        verbose_print("尝试使用回退模式")
+                        return try_fallback_mode(video_url, yt_dlp_path, playlist_info)
+                else:
+                    # Other errors
+                    print(f"\n--- ERROR: 'yt-dlp' failed (attempt {attempt + 1}/{max_retries}) ---", file=sys.stderr)
+                    print(f"-> Exit Code: {e.returncode}", file=sys.stderr)
+                    print(f"-> Error Message:\n{e.stderr}", file=sys.stderr)
+                    verbose_print(f"其他错误，尝试次数: {attempt + 1}/{max_retries}")
+                    if attempt < max_retries - 1:
+                        continue  # Retry for other errors too
+                    else:
+                        verbose_print("达到最大重试次数，返回None")
+                        return None
+                        
+            except Exception as e:
+                print(f"\nAN UNEXPECTED ERROR OCCURRED: {e}", file=sys.stderr)
+                return None
+        
+        return None
+
+def try_fallback_mode(video_url, yt_dlp_path, playlist_info):
+    """
+    Fallback mode with minimal options to avoid rate limiting.
+    Reuses the primary path's check_if_playlist_url result instead of parsing the URL again.
+    """
+    print("-> Attempting fallback mode with minimal options...")
+    verbose_print("进入回退模式")
     
-    command.append(video_url)
-    verbose_print(f"构建的yt-dlp命令: {' '.join(command)}")
+    is_playlist = playlist_info[0]
     
-    for attempt in range(max_retries):
+    with tempfile.TemporaryDirectory(prefix='ytcc-') as work_dir:
+        # Ultra-minimal command with network optimization
+        command = [
+            yt_dlp_path,
+            '--skip-download',
+            '--write-auto-subs',
+            '--sub-langs', 'en',
+            '--output', os.path.join(work_dir, 'fallback.%(ext)s'),
+            '--sleep-requests', '1',  # Throttle yt-dlp's own HTTP requests
+            '--socket-timeout', '60',  # 增加超时时间
+            '--retries', '3',  # 重试机制
+            '--retry-sleep', '5',  # 重试间隔
+        ]
+        
+        # 如果是播放列表URL，添加 --no-playlist 参数
+        if is_playlist:
+            command.append('--no-playlist')
+            print("-> 回退模式：检测到播放列表，只下载单个视频")
+            verbose_print("回退模式添加 --no-playlist 参数")
+        
+        command.append(video_url)
+        if CFG.verbose:
+            verbose_print("回退模式命令:", format_command(command))
+        
         try:
-            verbose_print(f"开始第 {attempt + 1} 次尝试")
-            if attempt > 0:
-                # Exponential backoff with jitter
-                delay = (2 ** attempt) + random.uniform(0, 2)
-                print(f"-> Retrying in {delay:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
-                verbose_print(f"等待 {delay:.1f} 秒后重试")
-                time.sleep(delay)
+            # Wait a bit more before fallback
+            verbose_print("回退模式等待5秒...")
+            time.sleep(5)
+            if CFG.verbose:
+                print(f"-> Running fallback command: {format_command(command)}")
+            verbose_print("执行回退模式命令...")
+            verbose_print(f"回退模式也有超时限制: {YT_DLP_IDLE_TIMEOUT}秒无输出或超过{YT_DLP_HARD_TIMEOUT}秒")
             
-            print(f"-> Running command: {' '.join(command)}")
-            verbose_print("执行yt-dlp命令...")
-            verbose_print("如果长时间无响应，请尝试 Ctrl+C 中断")
-            
-            # 添加超时机制，防止无限等待
             try:
-                result = subprocess.run(command, capture_output=True, text=True, 
-                                      check=True, encoding='utf-8', timeout=120)  # 2分钟超时
-                verbose_print(f"命令执行成功，返回码: {result.returncode}")
-                verbose_print(f"stdout长度: {len(result.stdout)}, stderr长度: {len(result.stderr)}")
-                if VERBOSE_MODE and result.stdout:
-                    verbose_print(f"yt-dlp输出摘要: {result.stdout[:200]}...")
-                if VERBOSE_MODE and result.stderr:
-                    verbose_print(f"yt-dlp错误信息: {result.stderr[:200]}...")
+                result = run_yt_dlp(command)
+                verbose_print(f"回退模式命令执行成功，返回码: {result.returncode}")
             except subprocess.TimeoutExpired:
-                print("-> 命令执行超时 (2分钟)，可能的原因：", file=sys.stderr)
-                print("   1. 网络连接慢或不稳定", file=sys.stderr)
-                print("   2. 视频可能没有可用的字幕", file=sys.stderr)
-                print("   3. YouTube限制了访问", file=sys.stderr)
-                verbose_print("yt-dlp命令执行超时")
-                continue  # 继续重试
-            
-            # yt-dlp should have created an .srt file in the current directory
-            # Find the generated subtitle file
-            srt_files = glob.glob('*.en*.srt')
-            verbose_print(f"搜索字幕文件，找到 {len(srt_files)} 个: {srt_files}")
-            if not srt_files:
-                print("-> No subtitle file was created. The video might not have auto-generated English subtitles.", file=sys.stderr)
+                print("-> 回退模式也超时了，建议：", file=sys.stderr)
+                print("   1. 检查网络连接", file=sys.stderr)
+                print("   2. 稍后再试", file=sys.stderr)
+                print("   3. 尝试不同的视频", file=sys.stderr)
+                verbose_print("回退模式命令执行超时")
                 return None
             
-            # Intelligently select the best subtitle file
-            verbose_print("开始智能选择字幕文件...")
-            selected_file = select_best_subtitle_file(srt_files, video_url)
-            if not selected_file:
-                print("-> No subtitle file selected.", file=sys.stderr)
+            # Look for any subtitle file
+            subtitle_files = list_subtitle_files(work_dir, marker='fallback.', suffix=('.vtt', '.srt'))
+            subtitle_files.sort(key=lambda name: not name.endswith('.vtt'))  # Prefer VTT, as before
+            verbose_print(f"回退模式搜索到 {len(subtitle_files)} 个字幕文件: {subtitle_files}")
+            if not subtitle_files:
+                print("-> Fallback mode: No subtitle file created.", file=sys.stderr)
+                verbose_print("回退模式：未找到字幕文件")
                 return None
             
-            print(f"-> Processing subtitle file: {selected_file}")
-            verbose_print(f"选定的字幕文件: {selected_file}")
-            
-            # Read and parse the SRT content
-            verbose_print("读取字幕文件内容...")
-            with open(selected_file, 'r', encoding='utf-8') as f:
-                srt_content = f.read()
+            subtitle_file = os.path.join(work_dir, subtitle_files[0])
+            print(f"-> Fallback mode: Found subtitle file: {subtitle_files[0]}")
+            verbose_print(f"回退模式选择文件: {subtitle_file}")
             
-            verbose_print(f"字幕文件大小: {len(srt_content)} 字符")
-            if not srt_content.strip():
-                print("-> Subtitle file was empty.", file=sys.stderr)
+            subtitle_size = os.path.getsize(subtitle_file)
+            verbose_print(f"回退模式文件大小: {subtitle_size} 字节")
+            if not subtitle_size:
+                print("-> Fallback mode: Subtitle file was empty.", file=sys.stderr)
+                verbose_print("回退模式：字幕文件为空")
                 return None
             
-            verbose_print("解析SRT内容...")
-            transcript = parse_srt(srt_content)
-            verbose_print(f"解析后的转录文本长度: {len(transcript) if transcript else 0} 字符")
-            
-            # Clean up ALL subtitle files (not just the selected one)
-            verbose_print("开始清理字幕文件...")
-            cleaned_files = []
-            for srt_file in srt_files:
-                try:
-                    os.remove(srt_file)
-                    cleaned_files.append(srt_file)
-                    verbose_print(f"已删除文件: {srt_file}")
-                except Exception as clean_error:
-                    verbose_print(f"删除文件失败 {srt_file}: {clean_error}")
-            
-            if cleaned_files:
-                print(f"-> Cleaned up {len(cleaned_files)} subtitle file(s)")
+            # Parse based on the detected file format, not the extension
+            verbose_print("回退模式流式解析字幕内容...")
+            transcript = parse_subtitle_file(subtitle_file)
             
+            verbose_print(f"回退模式解析结果长度: {len(transcript) if transcript else 0}")
             if transcript:
-                print("-> Subtitle successfully downloaded and parsed.")
-                verbose_print("字幕下载和解析成功完成")
+                print("-> Fallback mode: Success!")
+                verbose_print("回退模式成功完成")
                 return transcript
             else:
-                print("-> Failed to extract text from subtitle file.", file=sys.stderr)
-                verbose_print("从字幕文件提取文本失败")
+                print("-> Fallback mode: Failed to parse subtitle content.", file=sys.stderr)
+                verbose_print("回退模式：解析字幕内容失败")
                 return None
-
+                
         except subprocess.CalledProcessError as e:
-            error_message = e.stderr.lower() if e.stderr else ""
-            verbose_print(f"subprocess.CalledProcessError: 返回码={e.returncode}")
-            verbose_print(f"错误信息: {e.stderr}")
-            
-            # Check if it's a 429 error (rate limiting)
-            if "429" in error_message or "too many requests" in error_message:
-                print(f"-> Rate limited (429 error) on attempt {attempt + 1}/{max_retries}", file=sys.stderr)
-                verbose_print("检测到429限制错误")
-                if attempt < max_retries - 1:
-                    continue  # Retry
-                else:
-                    print("\n--- Trying fallback mode ---", file=sys.stderr)
-                    verbose_print("尝试使用回退模式")
-                    return try_fallback_mode(video_url, yt_dlp_path)
-            else:
-                # Other errors
-                print(f"\n--- ERROR: 'yt-dlp' failed (attempt {attempt + 1}/{max_retries}) ---", file=sys.stderr)
-                print(f"-> Exit Code: {e.returncode}", file=sys.stderr)
-                print(f"-> Error Message:\n{e.stderr}", file=sys.stderr)
-                verbose_print(f"其他错误，尝试次数: {attempt + 1}/{max_retries}")
-                if attempt < max_retries - 1:
-                    continue  # Retry for other errors too
-                else:
-                    verbose_print("达到最大重试次数，返回None")
-                    return None
-                    
+            print(f"-> Fallback mode also failed: {e.stderr}", file=sys.stderr)
+            print("-> Suggestions:", file=sys.stderr)
+            print("   1. Wait 10-15 minutes before trying again", file=sys.stderr)
+            print("   2. Try using a VPN to change your IP address", file=sys.stderr)
+            print("   3. Check if the video has subtitles available", file=sys.stderr)
+            return None
         except Exception as e:
-            print(f"\nAN UNEXPECTED ERROR OCCURRED: {e}", file=sys.stderr)
+            print(f"-> Fallback mode error: {e}", file=sys.stderr)
             return None
-        finally:
-            # Clean up any remaining .srt files in case of errors
-            remaining_files = glob.glob('*.en*.srt')
-            for srt_file in remaining_files:
-                try:
-                    os.remove(srt_file)
-                    print(f"-> Cleaned up remaining file: {srt_file}")
-                except:
-                    pass
-    
-    return None
 
-def try_fallback_mode(video_url, yt_dlp_path):
+def parse_vtt(vtt_content):
     """
-    Fallback mode with minimal options to avoid rate limiting.
+    Basic VTT (WebVTT) parser to extract text content.
     """
-    print("-> Attempting fallback mode with minimal options...")
-    verbose_print("进入回退模式")
-    
-    # 检查是否为播放列表URL
-    is_playlist, list_id, video_id = check_if_playlist_url(video_url)
-    
-    # Ultra-minimal command with network optimization
-    command = [
-        yt_dlp_path,
-        '--skip-download',
-        '--write-auto-subs',
-        '--sub-langs', 'en',
-        '--output', 'fallback.%(ext)s',
-        '--socket-timeout', '60',  # 增加超时时间
-        '--retries', '3',  # 重试机制
-        '--retry-sleep', '5',  # 重试间隔
-    ]
-    
-    # 如果是播放列表URL，添加 --no-playlist 参数
-    if is_playlist:
-        command.append('--no-playlist')
-        print("-> 回退模式：检测到播放列表，只下载单个视频")
-        verbose_print("回退模式添加 --no-playlist 参数")
-    
-    command.append(video_url)
-    verbose_print(f"回退模式命令: {' '.join(command)}")
-    
-    try:
-        # Wait a bit more before fallback
-        verbose_print("回退模式等待5秒...")
-        time.sleep(5)
-        print(f"-> Running fallback command: {' '.join(command)}")
-        verbose_print("执行回退模式命令...")
-        verbose_print("回退模式也有2分钟超时限制")
-        
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, 
-                                  check=True, encoding='utf-8', timeout=120)  # 2分钟超时
-            verbose_print(f"回退模式命令执行成功，返回码: {result.returncode}")
-        except subprocess.TimeoutExpired:
-            print("-> 回退模式也超时了，建议：", file=sys.stderr)
-            print("   1. 检查网络连接", file=sys.stderr)
-            print("   2. 稍后再试", file=sys.stderr)
-            print("   3. 尝试不同的视频", file=sys.stderr)
-            verbose_print("回退模式命令执行超时")
-            return None
-        
-        # Look for any subtitle file
-        subtitle_files = glob.glob('fallback.*.vtt') + glob.glob('fallback.*.srt')
-        verbose_print(f"回退模式搜索到 {len(subtitle_files)} 个字幕文件: {subtitle_files}")
-        if not subtitle_files:
-            print("-> Fallback mode: No subtitle file created.", file=sys.stderr)
-            verbose_print("回退模式：未找到字幕文件")
-            return None
-        
-        subtitle_file = subtitle_files[0]
-        print(f"-> Fallback mode: Found subtitle file: {subtitle_file}")
-        verbose_print(f"回退模式选择文件: {subtitle_file}")
-        
-        # Read the content
-        verbose_print("回退模式读取文件内容...")
-        with open(subtitle_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        verbose_print(f"回退模式文件大小: {len(content)} 字符")
-        
-        # Clean up
-        os.remove(subtitle_file)
-        print(f"-> Cleaned up fallback file: {subtitle_file}")
-        verbose_print(f"清理回退文件: {subtitle_file}")
-        
-        if not content.strip():
-            print("-> Fallback mode: Subtitle file was empty.", file=sys.stderr)
-            verbose_print("回退模式：字幕文件为空")
-            return None
-        
-        # Parse based on file type
-        verbose_print(f"回退模式解析文件类型: {subtitle_file}")
-        if subtitle_file.endswith('.srt'):
-            transcript = parse_srt(content)
-            verbose_print("使用SRT解析器")
-        else:
-            # Basic VTT parsing
-            transcript = parse_vtt(content)
-            verbose_print("使用VTT解析器")
-        
-        verbose_print(f"回退模式解析结果长度: {len(transcript) if transcript else 0}")
-        if transcript:
-            print("-> Fallback mode: Success!")
-            verbose_print("回退模式成功完成")
-            return transcript
-        else:
-            print("-> Fallback mode: Failed to parse subtitle content.", file=sys.stderr)
-            verbose_print("回退模式：解析字幕内容失败")
-            return None
-            
-    except subprocess.CalledProcessError as e:
-        print(f"-> Fallback mode also failed: {e.stderr}", file=sys.stderr)
-        print("-> Suggestions:", file=sys.stderr)
-        print("   1. Wait 10-15 minutes before trying again", file=sys.stderr)
-        print("   2. Try using a VPN to change your IP address", file=sys.stderr)
-        print("   3. Check if the video has subtitles available", file=sys.stderr)
-        return None
-    except Exception as e:
-        print(f"-> Fallback mode error: {e}", file=sys.stderr)
-        return None
-    finally:
-        # Clean up any remaining fallback files
-        for file in glob.glob('fallback.*'):
-            try:
-                os.remove(file)
-            except:
-                pass
+    return parse_vtt_stream(vtt_content.splitlines())
 
-def parse_vtt(vtt_content):
+def parse_vtt_stream(lines):
+    """Parses WebVTT lines from any iterable (e.g. an open file) to extract only the spoken text."""
+    lines = iter(lines)
+    first_line = next(lines, '')
+    if first_line.lstrip('\ufeff').startswith('WEBVTT'):
+        # The header (WEBVTT, Kind:, Language: ...) runs up to the first blank line;
+        # only here are those lines metadata rather than speech
+        for line in lines:
+            if not line.strip() or '-->' in line:
+                break
+    else:
+        lines = itertools.chain((first_line,), lines)
+    return _parse_subtitle(lines, _VTT_SKIP_RE)
+
+def parse_subtitle_file(path):
     """
-    Basic VTT (WebVTT) parser to extract text content.
+    Stream-parses a subtitle file, choosing the SRT or VTT parser from its first line
+    rather than its extension (yt-dlp can leave a WEBVTT file behind a .srt name).
     """
-    lines = []
-    seen_lines = set()
-    
-    for line in vtt_content.split('\n'):
-        line = line.strip()
-        # Skip WebVTT headers, timestamps, and empty lines
-        if (not line or line.startswith('WEBVTT') or 
-            line.startswith('NOTE') or '-->' in line or
-            line.startswith('<') or line.isdigit()):
-            continue
-        
-        # Remove any HTML-like tags
-        cleaned_line = re.sub(r'<[^>]+>', '', line)
-        cleaned_line = cleaned_line.strip()
-        
-        # Only add non-empty, unique lines
-        if cleaned_line and cleaned_line not in seen_lines:
-            lines.append(cleaned_line)
-            seen_lines.add(cleaned_line)
-    
-    return ' '.join(lines)
+    # utf-8-sig drops a leading BOM; newline='' skips the text layer's newline translation
+    with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        first_line = f.readline()
+        is_vtt = first_line.startswith('WEBVTT')
+        verbose_print(f"检测到字幕格式: {'VTT' if is_vtt else 'SRT'}")
+        parse_stream = parse_vtt_stream if is_vtt else parse_srt_stream
+        return parse_stream(itertools.chain((first_line,), f))
+
+def resolve_clipboard_backend():
+    """
+    Resolve pyperclip's clipboard backend off the main thread, but only when pyperclip will pick
+    a command-line or OS backend. Returns None when it could fall back to Qt instead, because
+    the QApplication it creates must live on the main thread; main() resolves it there.
+    """
+    if sys.platform not in ('win32', 'cygwin', 'darwin'):
+        has_display = os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')
+        safe = (not has_display
+                or (os.environ.get('WAYLAND_DISPLAY') and shutil.which('wl-copy'))
+                or shutil.which('xsel') or shutil.which('xclip'))
+        if not safe:
+            return None
+    return pyperclip.determine_clipboard()
 
 def main():
     parser = argparse.ArgumentParser(
@@ -454,39 +611,62 @@ def main():
                        help="Auto-select subtitle file without user interaction")
     parser.add_argument("--verbose", "-v", action="store_true",
                        help="Enable verbose output for debugging")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Ignore cached transcripts and download the subtitles again")
     parser.add_argument("--test-connection", "-t", action="store_true",
                        help="Test network connection to YouTube before downloading")
     args = parser.parse_args()
 
+    # Resolve pyperclip's clipboard backend (probing for pbcopy/xclip/...) in the
+    # background while yt-dlp downloads; this does not touch the clipboard itself
+    clipboard_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    clipboard_future = clipboard_pool.submit(resolve_clipboard_backend)
+    clipboard_pool.shutdown(wait=False)
+
     yt_dlp_path = find_yt_dlp()
     
-    # Set global modes
-    global AUTO_SELECT_MODE, VERBOSE_MODE
-    AUTO_SELECT_MODE = args.auto
-    VERBOSE_MODE = args.verbose
+    # Set runtime modes
+    CFG.auto = args.auto
+    CFG.verbose = args.verbose
     
-    if VERBOSE_MODE:
+    if CFG.verbose:
         print("[VERBOSE] 详细日志模式已启用")
         print(f"[VERBOSE] yt-dlp 路径: {yt_dlp_path}")
         print(f"[VERBOSE] 输入URL: {args.url}")
         print(f"[VERBOSE] 自动选择模式: {args.auto}")
         print(f"[VERBOSE] 连接测试模式: {args.test_connection}")
     
-    # 如果启用了连接测试或verbose模式，先测试网络连接
-    if args.test_connection or VERBOSE_MODE:
-        if not test_youtube_connection(yt_dlp_path):
-            if args.test_connection:
+    # Repeat runs on the same video reuse the cached transcript instead of hitting YouTube
+    # again; the connection test and the download only run on a cache miss
+    video_id = extract_video_id(args.url)
+    transcript = None if args.no_cache else load_cached_transcript(video_id)
+    if transcript:
+        print(f"-> Using cached transcript for video {video_id} (use --no-cache to download again)")
+    else:
+        stop_connection_test = None
+        # --test-connection 模式下先测试网络连接，失败则退出
+        if args.test_connection:
+            if not test_youtube_connection(yt_dlp_path):
                 print("\n💡 建议的解决方案：")
                 print("1. 检查网络连接是否正常")
                 print("2. 尝试使用VPN或更换网络")
                 print("3. 稍后再试（可能是临时的网络问题）")
                 print("4. 更新yt-dlp: pip install --upgrade yt-dlp")
                 sys.exit(1)
-            else:
-                print("⚠️  网络连接有问题，但将继续尝试下载...")
-    
-    verbose_print("开始获取转录文本...")
-    transcript = get_transcript_with_yt_dlp(args.url, yt_dlp_path)
+        elif CFG.verbose:
+            # verbose 模式下的连接测试仅供参考，与下载并行执行，不阻塞下载
+            stop_connection_test = start_background_connection_test(yt_dlp_path)
+        
+        verbose_print("开始获取转录文本...")
+        playlist_info = check_if_playlist_url(args.url)
+        try:
+            transcript = get_transcript_with_yt_dlp(args.url, yt_dlp_path, playlist_info, video_id)
+        finally:
+            # The download is over, so the background test's answer no longer matters
+            if stop_connection_test:
+                stop_connection_test()
+        if transcript:
+            save_cached_transcript(video_id, transcript)
 
     if transcript:
         verbose_print("成功获取转录文本")
@@ -495,10 +675,12 @@ def main():
         print("\n--------------------------\n")
         verbose_print("尝试复制到剪贴板...")
         try:
-            pyperclip.copy(transcript)
+            # None means the backend (possibly Qt) has to be resolved on the main thread
+            copy_to_clipboard, _ = clipboard_future.result() or pyperclip.determine_clipboard()
+            copy_to_clipboard(transcript)
             print("Success: Transcript has been copied to the clipboard.")
             verbose_print("成功复制到剪贴板")
-        except pyperclip.PyperclipException as e:
+        except Exception as e:  # PyperclipException, or anything the backend probe raised
             print(f"Warning: Could not copy to clipboard.", file=sys.stderr)
             verbose_print(f"复制到剪贴板失败: {e}")
     else:
@@ -506,30 +688,77 @@ def main():
         print("\n❌ Failed to extract transcript. Please check the video URL and try again.", file=sys.stderr)
         sys.exit(1)
 
-# Global variables
-AUTO_SELECT_MODE = False
-VERBOSE_MODE = False
+# Runtime settings, filled in from the command line by main()
+CFG = SimpleNamespace(auto=False, verbose=False)
 
 def verbose_print(*args, **kwargs):
     """打印详细日志信息，仅在 verbose 模式下输出"""
-    if VERBOSE_MODE:
+    if CFG.verbose:
         print("[VERBOSE]", *args, **kwargs)
 
-def test_youtube_connection(yt_dlp_path):
-    """测试到YouTube的网络连接"""
-    print("🔗 测试网络连接到YouTube...")
-    
-    test_command = [
+def connection_test_command(yt_dlp_path):
+    """yt-dlp command used to test the connection to YouTube"""
+    return [
         yt_dlp_path,
         '--list-formats',
         '--socket-timeout', '30',
         'https://www.youtube.com/watch?v=jNQXAC9IVRw'  # YouTube官方测试视频
     ]
+
+def start_background_connection_test(yt_dlp_path):
+    """
+    Start the connection test alongside the download (verbose mode, for reference only).
+    Returns a function that abandons the test: it terminates yt-dlp and silences the report,
+    so a finished download never waits on the test. The watcher thread is a daemon and
+    does not keep the interpreter alive either.
+    """
+    print("🔗 后台测试网络连接到YouTube...")
+    test_command = connection_test_command(yt_dlp_path)
+    verbose_print("测试命令:", format_command(test_command))
+    try:
+        process = subprocess.Popen(test_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='replace')
+    except OSError as e:
+        verbose_print(f"连接测试异常: {e}")
+        return lambda: None
+    abandoned = threading.Event()
+    
+    def report():
+        try:
+            _, stderr = process.communicate(timeout=45)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            stderr = "timeout"
+        if abandoned.is_set():
+            return
+        if process.returncode == 0:
+            verbose_print("YouTube连接测试成功")
+        else:
+            print("⚠️  网络连接有问题，下载仍在继续...")
+            verbose_print(f"连接测试失败: {stderr[:200]}")
+    
+    def stop():
+        abandoned.set()
+        if process.poll() is None:
+            verbose_print("下载已结束，终止后台连接测试")
+            process.terminate()
+    
+    threading.Thread(target=report, daemon=True).start()
+    return stop
+
+def test_youtube_connection(yt_dlp_path):
+    """测试到YouTube的网络连接"""
+    print("🔗 测试网络连接到YouTube...")
+    
+    test_command = connection_test_command(yt_dlp_path)
     
     try:
-        verbose_print(f"测试命令: {' '.join(test_command)}")
-        result = subprocess.run(test_command, capture_output=True, text=True, 
-                              timeout=45, encoding='utf-8')
+        if CFG.verbose:
+            verbose_print("测试命令:", format_command(test_command))
+        # The format list on stdout is never read; only stderr is shown on failure
+        result = subprocess.run(test_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              text=True, timeout=45, encoding='utf-8')
         
         if result.returncode == 0:
             print("✅ 网络连接正常")